@@ -1,7 +1,7 @@
 # Author
 # William Lucca
 
-from time import perf_counter
+from time import perf_counter, sleep
 from launchpad import *
 from snake_game import SnakeGame
 import math
@@ -12,20 +12,43 @@ BUT_RIGHT = (3, 0)
 BUT_START = (8, 7)
 BUT_QUIT = (8, 8)
 
+# Menu loop
+FRAME_DELAY = 1 / 60  # Cap the menu at 60 frames per second
+
+# Where each color of a game's flattened cover art (cover_flat) is drawn
+COVER_COORDS = [(i + 1, j + 2) for i in range(6) for j in range(6)]
+
 # Cover art border
 BORDER_ANIM_DELAY = 0.08
+BORDER_ANIM_SPEED = 2  # Radians per second
+BORDER_PHASES = 64  # Number of precomputed frames in one period of the animation
 BORDER_COORDS = [(0, 0) for i in range(28)]  # 28 border squares around cover
 for i in range(7):
     BORDER_COORDS[i] = (i, 1)  # Top row
     BORDER_COORDS[i + 7] = (7, i + 1)  # Right column
     BORDER_COORDS[i + 14] = (7 - i, 8)  # Bottom row
     BORDER_COORDS[i + 21] = (0, (7 - i) + 1)  # Left column
+
+# Border LEDs (x, y, R, G) for every phase of the animation, so no sines are
+# computed while drawing
+BORDER_LUT = [[(0, 0, 0, 0) for i in range(28)] for p in range(BORDER_PHASES)]
+for p in range(BORDER_PHASES):
+    for i in range(28):
+        # Sine wave with period 28, shifted by the phase
+        sine = math.sin(2 * math.pi * (i / 28 + p / BORDER_PHASES))
+        
+        # Map sine value from [-1, 1] to [0, 4) (int() floors, as 2*sine+2 >= 0)
+        red = min(int(2 * sine + 2), 3)
+        
+        # Fade red and green colors
+        BORDER_LUT[p][i] = (*BORDER_COORDS[i], red, 3 - red)
     
 # Menu leds
 menu_leds = [(0, 0) for i in range(16)]
 
 # Game dictionary
 games = {}
+cover_leds = {}  # Each game's cover art as a list of (x, y, red, green) LEDs
 selected_game = 0
 
 lp = None
@@ -46,6 +69,11 @@ def main():
     draw_main_menu()
     
     playing = True
+    
+    # Launchpad methods called every frame
+    poll_events = lp.poll_events
+    button_state_xy = lp.button_state_xy
+    draw = lp.draw_rapid
 
     # Timekeeping
     last_time = 0
@@ -58,13 +86,14 @@ def main():
         last_time = cur_time
 
         # Get next input
-        button = lp.button_state_xy()
+        poll_events()
+        button = button_state_xy()
         
         # Animate border
         anim_timer += delta_time
         if anim_timer > BORDER_ANIM_DELAY:
             anim_timer = 0
-            draw_border()
+            draw_border(cur_time)
         
         # Handle input (if any)
         if button:
@@ -101,8 +130,17 @@ def main():
                 
                 if (x, y) == BUT_QUIT:
                     playing = False
+                    
+                    # Skip the last frame, reset() below clears it anyway
+                    break
+        
+        draw()
         
-        lp.draw()
+        # Sleep for the rest of the frame instead of spinning. Any button
+        # pressed meanwhile is read at the top of the next frame.
+        sleep_time = FRAME_DELAY - (perf_counter() - cur_time)
+        if sleep_time > 0:
+            sleep(sleep_time)
     
     lp.reset()
     lp.close()
@@ -111,36 +149,32 @@ def main():
 def draw_cover():
     """Draws the selected game's cover art"""
     
-    game_cover = games[selected_game].cover
+    led_ctrl_xy = lp.led_ctrl_xy
     
     # Draw game cover art
-    for i in range(len(game_cover)):
-        for j in range(len(game_cover[0])):
-            led_x = i + 1
-            led_y = j + 2
-            lp.led_ctrl_xy(led_x, led_y, *game_cover[i][j])
+    for led in cover_leds[selected_game]:
+        led_ctrl_xy(*led)
 
 
-def draw_border():
-    """Draws one frame of the colored border animation"""
+def draw_border(t=None):
+    """Draws one frame of the colored border animation
     
-    length = len(BORDER_COORDS)
+    :param t: Time (from perf_counter) of the frame being drawn, shared by the
+    whole border. Defaults to the current time.
+    """
+    
+    if t is None:
+        t = perf_counter()
     
-    # Constants for sine wave
-    b = 2 * math.pi / length
-    speed = 2
+    # Current phase of the animation
+    phase = int(BORDER_ANIM_SPEED * t * BORDER_PHASES
+                / (2 * math.pi)) % BORDER_PHASES
+    
+    led_ctrl_xy = lp.led_ctrl_xy
     
     # Draw sinusoid red/green design
-    for i in range(length):
-        # Sine function
-        t = perf_counter()
-        sine = math.sin(b*i + speed*t)  # Wave with period 28
-        
-        # Map sine value from [-1, 1] to [0, 4)
-        red = min(math.floor(2 * sine + 2), 3)
-        
-        # Fade red and green colors
-        lp.led_ctrl_xy(*BORDER_COORDS[i], red, 3 - red)
+    for led in BORDER_LUT[phase]:
+        led_ctrl_xy(*led)
 
 
 def draw_menu_buttons():
@@ -161,10 +195,8 @@ def draw_menu_buttons():
         else:
             menu_leds[x] = color
     
-    # Clear all circular buttons
-    for i in range(8):
-        draw_menu_led(i, 0, (0, 0))
-        draw_menu_led(8, i + 1, (0, 0))
+    # All circular buttons start off (draw_main_menu() reset the launchpad)
+    menu_leds[:] = [(0, 0)] * 16
     
     # Color all menu buttons
     draw_menu_led(*BUT_LEFT, (3, 3))  # Select buttons yellow
@@ -175,6 +207,10 @@ def draw_menu_buttons():
 
 def draw_main_menu():
     """Draws the cover art, menu buttons, and cover art border"""
+    
+    # One reset message clears every LED, so only lit ones need drawing
+    lp.reset()
+    
     draw_cover()
     draw_menu_buttons()
     draw_border()
@@ -184,6 +220,12 @@ def populate_games():
     """Initializes all of the game objects in the games dictionary"""
     global games
     games[0] = SnakeGame(lp)
+    
+    # Place each game's cover art once, so drawing it is a single loop
+    for key, game in games.items():
+        cover_leds[key] = [(*coord, *color)
+                           for coord, color in zip(COVER_COORDS,
+                                                   game.cover_flat)]
 
 
 if __name__ == '__main__':
@@ -66,6 +66,8 @@
 import string
 import random
 import sys
+from collections import deque
+from time import perf_counter, sleep
 
 from pygame import midi
 from pygame import time
@@ -74,6 +76,36 @@ from launchpad_charset import *
 
 MIDI_BUFFER_OUT = 128  # intended for real-time behaviour, but does not have any effect
 MIDI_BUFFER_IN = 512  # same here...
+MIDI_BATCH_MAX = 1024  # most messages pygame.midi accepts in one write() call
+# Fewest messages sent with one write() call. Building write()'s message list costs
+# about as much as two write_short() calls, so one or two messages go out singly.
+MIDI_BATCH_MIN = 3
+INPUT_WAIT_SLICE = 0.01  # default seconds slept between input checks in wait_for_input()
+
+RAPID_LED_COUNT = 80  # grid, right column and automap LEDs, in rapid update order
+RAPID_MIN_WRITES = 16  # fewer buffered writes than this are cheaper to send one by one
+
+NO_BUFFER_SLOTS = [-1] * RAPID_LED_COUNT  # template for an empty Launchpad._buf_slots
+
+LED_UNKNOWN = 0xff  # LED shadow value of an LED whose color isn't known
+SHADOW_OFF = bytes(RAPID_LED_COUNT)  # LED shadow with every LED off
+SHADOW_UNKNOWN = bytes([LED_UNKNOWN]) * RAPID_LED_COUNT  # LED shadow with no LED known
+
+# Positions of the set bits of every byte, counted from the most significant bit.
+# Used to draw font rows (see CHARTAB) without testing every pixel.
+BIT_POS = [[i for i in range(8) if b & (0x80 >> i)] for b in range(256)]
+
+# (rapid update index, status, number) of the LED at every on-device (x, y)
+XY_LEDS = {}
+for _y in range(9):
+    for _x in range(9):
+        if _y == 0:
+            XY_LEDS[(_x, _y)] = (72 + min(_x, 7), 176, 104 + min(_x, 7))
+        elif _x < 8:
+            XY_LEDS[(_x, _y)] = (((_y - 1) << 3) | _x, 144, ((_y - 1) << 4) | _x)
+        else:
+            XY_LEDS[(_x, _y)] = (63 + _y, 144, ((_y - 1) << 4) | 8)
+del _x, _y
 
 
 ########################################################################################
@@ -176,6 +208,12 @@ class Midi:
     def ReadRaw(self):
         return self.devIn.read(1)
     
+    # -------------------------------------------------------------------------------------
+    # -- Returns every pending event (up to <n>) with a single read, or [] if none
+    # -------------------------------------------------------------------------------------
+    def ReadAll(self, n=MIDI_BUFFER_IN):
+        return self.devIn.read(n) if self.devIn.poll() else []
+    
     # -------------------------------------------------------------------------------------
     # -- sends a single, short message
     # -------------------------------------------------------------------------------------
@@ -190,6 +228,15 @@ class Midi:
     # -------------------------------------------------------------------------------------
     def RawWriteMulti(self, msgTable):
         self.devOut.write(msgTable)
+    
+    # -------------------------------------------------------------------------------------
+    # -- Sends a list of short messages with as few calls as possible.
+    # -- [ [stat, dat1, dat2], [...], ... ]
+    # -- All messages share a timestamp of 0, so they go out immediately and in order.
+    # -------------------------------------------------------------------------------------
+    def WriteBatch(self, msgs):
+        for i in range(0, len(msgs), MIDI_BATCH_MAX):
+            self.devOut.write([[msg, 0] for msg in msgs[i:i + MIDI_BATCH_MAX]])
 
 
 ########################################################################################
@@ -249,13 +296,28 @@ class Launchpad:
     # +---+---+---+---+---+---+---+---+  +---+
     #
     
-    draw_buffer = []
+    # Color code bytes for every in-range (red, green) pair, see led_get_color()
+    _color_cache = {(r, g): r | (g << 4) for r in range(4) for g in range(4)}
     
     def __init__(self):
         self.midi = Midi()  # midi interface class
         self.idOut = None  # midi id for output
         self.idIn = None  # midi id for input
         
+        # Last color written to each LED, in rapid update order (see rapid_index()).
+        # Nothing is known about the LEDs until the first reset().
+        self._led_shadow = bytearray(SHADOW_UNKNOWN)
+        
+        # Pending LED writes as consecutive (status, number, led) MIDI messages.
+        # Preallocated for one message per LED; a second write to an LED within
+        # the same frame overwrites its message (see _buf_slots).
+        self._buf = bytearray(3 * RAPID_LED_COUNT)
+        self._buf_len = 0
+        self._buf_slots = NO_BUFFER_SLOTS[:]  # offset in _buf of each LED's message
+        
+        # Button events read from MIDI but not yet returned by button_state_*()
+        self._pending_events = deque()
+        
         # just in case someone likes "defines" ;)
         SCROLL_NONE = 0
         SCROLL_LEFT = -1
@@ -311,6 +373,7 @@ class Launchpad:
     
     def close_input(self):
         self.midi.CloseInput()
+        self._pending_events.clear()
         
         return True
     
@@ -318,9 +381,10 @@ class Launchpad:
     # -- Clears input from midi input buffer
     # -------------------------------------------------------------------------------------
     def clear_input(self):
-        # If it has input, pop it. Repeat.
-        while self.midi.ReadCheck():
-            self.midi.ReadRaw()
+        # Pop all input at once. Repeat until nothing is left.
+        self._pending_events.clear()
+        while self.midi.ReadAll():
+            pass
     
     # -------------------------------------------------------------------------------------
     # -- Closes everything
@@ -339,7 +403,27 @@ class Launchpad:
     # -------------------------------------------------------------------------------------
     def reset(self):
         self.midi.RawWrite(176, 0, 0)
-        self.draw_buffer.clear()
+        self.clear_buffer()
+        self._led_shadow[:] = SHADOW_OFF
+    
+    # -------------------------------------------------------------------------------------
+    # -- Returns the position of an LED in the rapid update order:
+    # -- 0..63 grid (left to right, top to bottom), 64..71 right column, 72..79 automap
+    # -- Returns None for numbers that don't belong to an LED.
+    # -------------------------------------------------------------------------------------
+    def rapid_index(self, status, number):
+        if status == 176:
+            return 72 + number - 104
+        
+        x = number & 0x0f
+        y = number >> 4
+        
+        if x < 8:
+            return (y << 3) | x
+        elif x == 8:
+            return 64 + y
+        
+        return None
     
     # -------------------------------------------------------------------------------------
     # -- Returns a Launchpad compatible "color code byte"
@@ -372,23 +456,105 @@ class Launchpad:
             number = min(int(number), 120)  # make int and limit to <=127
             number = max(number, 0)  # no negative numbers
             
-            led = self.led_get_color(red, green)
+            led = self._color_cache.get((red, green))
+            if led is None:
+                led = self.led_get_color(red, green)
+            
+            # Numbers 9..15 of each row don't belong to any LED
+            index = self.rapid_index(144, number)
+            if index is None:
+                return
             
-            self.draw_buffer.append((144, number, led))
+            # Skip LEDs that already show (or are about to show) this color
+            if self._led_shadow[index] == led:
+                return
+            
+            self._led_shadow[index] = led
+            self.buffer_led(index, 144, number, led)
     
     # -------------------------------------------------------------------------------------
     # -- Controls a grid LED by its coordinates <x> and <y>  with <green/red> brightness 0..3
+    # -- This is what every game draws with, so led_ctrl_automap()/led_ctrl_raw() and
+    # -- buffer_led() are inlined here rather than called.
     # -------------------------------------------------------------------------------------
     def led_ctrl_xy(self, x, y, red, green):
         
         if x < 0 or y > 8 or y < 0 or y > 8:
             return
         
-        if y == 0:
-            self.led_ctrl_automap(x, red, green)
+        led = self._color_cache.get((red, green))
+        if led is None:
+            led = self.led_get_color(red, green)
         
+        # Find the MIDI message and rapid update position of the LED
+        if y == 0:
+            x = min(x, 7)
+            status = 176
+            number = 104 + x
+            index = 72 + x
+        elif x < 8:
+            status = 144
+            number = ((y - 1) << 4) | x
+            index = ((y - 1) << 3) | x
+        elif x == 8:
+            status = 144
+            number = ((y - 1) << 4) | 8
+            index = 63 + y
         else:
-            self.led_ctrl_raw(((y - 1) << 4) | x, red, green)
+            return
+        
+        # Skip LEDs that already show (or are about to show) this color
+        shadow = self._led_shadow
+        if shadow[index] == led:
+            return
+        shadow[index] = led
+        
+        # Queue the message, overwriting the LED's earlier one from this frame
+        buf = self._buf
+        pos = self._buf_slots[index]
+        if pos < 0:
+            pos = self._buf_len
+            buf[pos] = status
+            buf[pos + 1] = number
+            self._buf_len = pos + 3
+            self._buf_slots[index] = pos
+        buf[pos + 2] = led
+    
+    # -------------------------------------------------------------------------------------
+    # -- Sets every LED in <coords>, a list of (x, y) coordinates, to the same
+    # -- <green/red> brightness 0..3. The color is looked up once for all of them.
+    # -------------------------------------------------------------------------------------
+    def led_ctrl_xy_multi(self, coords, red, green):
+        
+        led = self._color_cache.get((red, green))
+        if led is None:
+            led = self.led_get_color(red, green)
+        
+        shadow = self._led_shadow
+        for xy in coords:
+            msg = XY_LEDS.get(xy)
+            if msg is None:
+                continue
+            
+            # Skip LEDs that already show (or are about to show) this color
+            index = msg[0]
+            if shadow[index] != led:
+                shadow[index] = led
+                self.buffer_led(index, msg[1], msg[2], led)
+    
+    # -------------------------------------------------------------------------------------
+    # -- Sets all 64 grid LEDs from <leds>, a table of color code bytes (see LedGetColor())
+    # -- in rapid update order: left to right, top to bottom.
+    # -- Only the LEDs that change are queued. A full frame is best sent with draw_rapid().
+    # -------------------------------------------------------------------------------------
+    def led_ctrl_grid(self, leds):
+        shadow = self._led_shadow
+        
+        for index in range(64):
+            led = leds[index]
+            if shadow[index] != led:
+                shadow[index] = led
+                self.buffer_led(index, 144, ((index >> 3) << 4) | (index & 7), led)
     
     # -------------------------------------------------------------------------------------
     # -- Sends a table of consecutive, special color values to the Launchpad.
@@ -401,10 +567,19 @@ class Launchpad:
     # -- Function LedGetColor() will do the coding for you...
     # -- Notice that the amount of LEDs needs to be even.
     # .. If an odd number of values is sent, the next, following LED is turned off!
+    # -- LED writes still queued for draw() are sent first, so they can't overwrite the
+    # -- frame later (the LED shadow already holds the frame's colors).
     # -------------------------------------------------------------------------------------
     def led_ctrl_raw_rapid(self, allLeds):
+        self.draw()
+        
         le = len(allLeds)
         
+        # Keep the shadow in sync (an odd count also turns the following LED off)
+        shadow = self._led_shadow
+        for i in range(min(le + le % 2, RAPID_LED_COUNT)):
+            shadow[i] = allLeds[i] if i < le else 0
+        
         for i in range(0, le, 2):
             self.midi.RawWrite(146, allLeds[i], allLeds[i + 1] if i + 1 < le else 0)
     
@@ -434,15 +609,55 @@ class Launchpad:
         number = min(int(number), 7)  # make int and limit to <=7
         number = max(number, 0)  # minimum is 104
         
-        led = self.led_get_color(red, green)
+        led = self._color_cache.get((red, green))
+        if led is None:
+            led = self.led_get_color(red, green)
         
-        self.draw_buffer.append((176, 104 + number, led))
+        # Skip LEDs that already show (or are about to show) this color
+        index = self.rapid_index(176, 104 + number)
+        if self._led_shadow[index] == led:
+            return
+        
+        self._led_shadow[index] = led
+        self.buffer_led(index, 176, 104 + number, led)
+    
+    # -------------------------------------------------------------------------------------
+    # -- Queues the MIDI message (status, number, led) for the LED at rapid update
+    # -- position <index>, overwriting the LED's message if it already has one queued.
+    # -------------------------------------------------------------------------------------
+    def buffer_led(self, index, status, number, led):
+        pos = self._buf_slots[index]
+        
+        if pos < 0:
+            pos = self._buf_len
+            self._buf[pos] = status
+            self._buf[pos + 1] = number
+            self._buf_len = pos + 3
+            self._buf_slots[index] = pos
+        
+        self._buf[pos + 2] = led
+    
+    # -------------------------------------------------------------------------------------
+    # -- Drops all queued LED writes
+    # -------------------------------------------------------------------------------------
+    def clear_buffer(self):
+        if self._buf_len:
+            self._buf_len = 0
+            self._buf_slots[:] = NO_BUFFER_SLOTS
+    
+    # -------------------------------------------------------------------------------------
+    # -- True if there are queued LED writes waiting for draw()
+    # -------------------------------------------------------------------------------------
+    @property
+    def dirty(self):
+        return self._buf_len > 0
     
     # -------------------------------------------------------------------------------------
     # -- all LEDs on
     # -------------------------------------------------------------------------------------
     def led_all_on(self):
         self.midi.RawWrite(176, 0, 127)
+        self._led_shadow[:] = SHADOW_UNKNOWN
     
     # -------------------------------------------------------------------------------------
     # -- Sends character <char> in colors <red/green> and lateral offset <offsx> (-8..8)
@@ -453,81 +668,163 @@ class Launchpad:
         char = min(char, 255)
         char = max(char, 0) * 8
         
-        for i in range(0, 8 * 16, 16):
-            for j in range(8):
-                sum = i + j + offsx
-                if sum >= i and sum < i + 8:
-                    if CHARTAB[char] & 0x80 >> j:
-                        self.led_ctrl_raw(sum, red, green)
-                    else:
-                        self.led_ctrl_raw(sum, 0, 0)
+        # Columns that are still on the grid after shifting by offsx
+        if offsx >= 0:
+            visible = 0xff >> offsx
+        else:
+            visible = (0xff << -offsx) & 0xff
+        
+        led_ctrl_xy = self.led_ctrl_xy
+        
+        for y in range(1, 9):
+            # Font row, shifted so that bit 7 is the leftmost column of the grid
+            if offsx >= 0:
+                row = CHARTAB[char] >> offsx
+            else:
+                row = (CHARTAB[char] << -offsx) & 0xff
+            
+            for x in BIT_POS[row]:
+                led_ctrl_xy(x, y, red, green)
+            for x in BIT_POS[visible & ~row]:
+                led_ctrl_xy(x, y, 0, 0)
+            
             char += 1
     
     # -------------------------------------------------------------------------------------
     # -- Scroll a string, as fast as we can, over the Launch pad.
     # -- Dir specifies: -1 to left, 0 no scroll, 1 to right
     # -- The "no scroll" characters are sent 8 times to have a comparable speed.
+    # -- Frames are drawn every <delay> ms on a fixed schedule, so the time spent
+    # -- drawing doesn't add up over the length of the string.
     # -------------------------------------------------------------------------------------
     def led_ctrl_string(self, str, red, green, dir=0, delay=50):
         
         if dir == -1:
-            for i in str:
-                for off in range(5, -8, -1):
-                    self.led_ctrl_char(i, red, green, off)
-                    time.wait(delay)
+            offsets = range(5, -8, -1)
         elif dir == 0:
-            for i in str:
-                for off in range(4):
-                    self.led_ctrl_char(i, red, green)
-                    time.wait(delay)
+            offsets = [0] * 4
         elif dir == 1:
-            for i in str:
-                for off in range(-5, 8):
-                    self.led_ctrl_char(i, red, green, off)
-                    time.wait(delay)
+            offsets = range(-5, 8)
+        else:
+            return
+        
+        next_frame = time.get_ticks()
+        
+        for i in str:
+            for off in offsets:
+                self.led_ctrl_char(i, red, green, off)
+                self.draw()
+                
+                next_frame += delay
+                time.wait(max(next_frame - time.get_ticks(), 0))
     
     # -------------------------------------------------------------------------------------
     # -- Returns True if a button event was received.
     # -------------------------------------------------------------------------------------
     def button_changed(self):
-        return self.midi.ReadCheck()
+        return len(self._pending_events) > 0 or self.midi.ReadCheck()
+    
+    # -------------------------------------------------------------------------------------
+    # -- Fetches all events waiting in the MIDI input in one go and queues them for
+    # -- button_state_raw()/button_state_xy(). Call this once per frame, before
+    # -- reading the buttons.
+    # -------------------------------------------------------------------------------------
+    def poll_events(self):
+        self._pending_events.extend(self.midi.ReadAll())
+    
+    # -------------------------------------------------------------------------------------
+    # -- Sleeps until a button event arrives or <timeout> seconds have passed.
+    # -- Returns True if there is input to read.
+    # -- PortMidi has no way to block on input, so this checks for input every <wait_slice>
+    # -- seconds. A longer slice means fewer wakeups while idle, a shorter one reacts
+    # -- to buttons sooner.
+    # -------------------------------------------------------------------------------------
+    def wait_for_input(self, timeout, wait_slice=INPUT_WAIT_SLICE):
+        deadline = perf_counter() + timeout
+        
+        while not self._pending_events and not self.midi.ReadCheck():
+            remaining = deadline - perf_counter()
+            if remaining <= 0:
+                return False
+            
+            sleep(min(remaining, wait_slice))
+        
+        return True
+    
+    # -------------------------------------------------------------------------------------
+    # -- Returns the next event queued by poll_events(), or None if there is none.
+    # -------------------------------------------------------------------------------------
+    def next_event(self):
+        if self._pending_events:
+            return self._pending_events.popleft()
+        
+        return None
     
     # -------------------------------------------------------------------------------------
-    # -- Returns the raw value of the last button change as a table:
+    # -- Returns the raw value of the next queued button change as a table:
     # -- [ <button>, <True/False> ]
+    # -- Returns [] if nothing is queued (see poll_events()).
     # -------------------------------------------------------------------------------------
     def button_state_raw(self):
-        if self.midi.ReadCheck():
-            a = self.midi.ReadRaw()
-            return [a[0][0][1] if a[0][0][0] == 144 else a[0][0][1] + 96, True if a[0][0][2] > 0 else False]
+        a = self.next_event()
+        if a:
+            return [a[0][1] if a[0][0] == 144 else a[0][1] + 96, True if a[0][2] > 0 else False]
         else:
             return []
     
     # -------------------------------------------------------------------------------------
-    # -- Returns an x/y value of the last button change as a table:
+    # -- Returns an x/y value of the next queued button change as a table:
     # -- [ <x>, <y>, <True/False> ]
+    # -- Returns [] if nothing is queued (see poll_events()).
     # -------------------------------------------------------------------------------------
     def button_state_xy(self):
-        if self.midi.ReadCheck():
-            a = self.midi.ReadRaw()
-            
-            if a[0][0][0] == 144:
-                x = a[0][0][1] & 0x0f
-                y = (a[0][0][1] & 0xf0) >> 4
+        a = self.next_event()
+        if a:
+            if a[0][0] == 144:
+                x = a[0][1] & 0x0f
+                y = (a[0][1] & 0xf0) >> 4
                 
-                return [x, y + 1, True if a[0][0][2] > 0 else False]
+                return [x, y + 1, True if a[0][2] > 0 else False]
             
-            elif a[0][0][0] == 176:
-                return [a[0][0][1] - 104, 0, True if a[0][0][2] > 0 else False]
+            elif a[0][0] == 176:
+                return [a[0][1] - 104, 0, True if a[0][2] > 0 else False]
         
         return []
     
     def draw(self):
-        # Write every light change in the draw_buffer
-        for light_write_data in self.draw_buffer:
-            self.midi.RawWrite(*light_write_data)
+        buf = self._buf
+        buf_len = self._buf_len
+        
+        # Write every light change in the buffer
+        if buf_len >= 3 * MIDI_BATCH_MIN:
+            # One write for the whole buffer instead of one per LED
+            self.midi.WriteBatch([buf[i:i + 3] for i in range(0, buf_len, 3)])
+        else:
+            for i in range(0, buf_len, 3):
+                self.midi.RawWrite(buf[i], buf[i + 1], buf[i + 2])
+        
+        self.clear_buffer()
+    
+    # -------------------------------------------------------------------------------------
+    # -- Same as draw(), but a dense buffer is sent as one full rapid update (two LEDs
+    # -- per message) built from the LED shadow, halving the MIDI traffic.
+    # -- Sparse buffers, or ones drawn while some LED colors are unknown, fall back
+    # -- to draw().
+    # -------------------------------------------------------------------------------------
+    def draw_rapid(self):
+        shadow = self._led_shadow
+        
+        if self._buf_len < 3 * RAPID_MIN_WRITES or LED_UNKNOWN in shadow:
+            self.draw()
+            return
+        
+        # Selecting the (default) X-Y layout resets the rapid update cursor
+        msgs = [[176, 0, 1]]
+        msgs += [[146, shadow[i], shadow[i + 1]]
+                 for i in range(0, RAPID_LED_COUNT, 2)]
+        self.midi.WriteBatch(msgs)
         
-        self.draw_buffer.clear()
+        self.clear_buffer()
 
 
 ########################################################################################
@@ -576,6 +873,7 @@ def demo():
                         random.randint(0, 3),
                         random.randint(0, 3))
         time.wait(10)
+        LP.poll_events()
         but = LP.button_state_raw()
         if but != []:
             print(but[0])
@@ -597,6 +895,7 @@ def demo():
     # turn off every pressed key
     print("---\nPress some buttons. End by pushing ARM.")
     while 1:
+        LP.poll_events()
         but = LP.button_state_raw()
         if but:
             print(but)
@@ -608,6 +907,7 @@ def demo():
     print("---\nPress some buttons. End by pushing ARM.")
     while True:
         time.wait(10)
+        LP.poll_events()
         but = LP.button_state_xy()
         if but:
             LP.led_ctrl_xy(but[0], but[1], 3, 0)
@@ -1,8 +1,24 @@
 # Author
 # William Lucca
 
-from time import perf_counter
+from time import perf_counter_ns
 from launchpad import *
+from itertools import accumulate
+import heapq
+
+# The game loop keeps time in integer nanoseconds (from perf_counter_ns) so
+# that deadlines never lose precision, while the public API uses seconds
+NS_PER_SEC = 1000000000
+
+
+def flatten_cover(cover):
+    """Returns a game's cover art as one flat tuple of colors
+    
+    :param cover: 6x6 grid of colors (R, G), indexed as cover[x][y]
+    :return: The colors in the order cover[0][0], cover[0][1], ...
+    """
+    
+    return tuple(color for column in cover for color in column)
 
 
 class LaunchpadGame:
@@ -12,35 +28,64 @@ class LaunchpadGame:
     functions and properties use seconds.
     """
     
-    # Launchpad
-    lp = None
+    # Per-game state read by the game loop is kept in slots instead of a
+    # __dict__. Subclasses may still add their own attributes (and get a
+    # __dict__ for them) unless they declare __slots__ too. Settings that
+    # subclasses override as class attributes can't be slots.
+    __slots__ = ('lp', 'playing', 'game_start_time_ns', 'prev_time_ns',
+                 'delta_time', 'timers', '_next_timer_id', '_timer_heap',
+                 '_btn_handlers')
     
     # Game loop
     fixed_update_delay = 0.0333333333  # Default to 30Hz
-    fixed_update_timer = 0
-    playing = True
-    
-    # Timekeeping
-    game_start_time = 0
-    prev_time = 0
-    delta_time = 0
-    
-    # Timers created by start_timer
-    timers = {}
+    fixed_update_max_steps = 5  # Most fixed updates to catch up on in a loop
     
     # Cover art for the game (default to all yellow)
     # Must be a 6x6 grid of colors (R, G)
     cover = [[(3, 3) for i in range(6)] for j in range(6)]
     
+    # The cover art flattened by flatten_cover(), done once per game class
+    cover_flat = flatten_cover(cover)
+    
+    def __init_subclass__(cls, **kwargs):
+        """Flatten the cover art of each game class when it's defined"""
+        
+        super().__init_subclass__(**kwargs)
+        cls.cover_flat = flatten_cover(cls.cover)
+    
     def __init__(self, launchpad_):
         # Store launchpad instance
         self.lp = launchpad_
+        
+        # Game loop
+        self.playing = True
+        
+        # Timekeeping (delta_time in seconds, the rest in nanoseconds)
+        self.game_start_time_ns = 0
+        self.prev_time_ns = 0
+        self.delta_time = 0
+        
+        # Timers created by start_timer, so each game has its own
+        self.timers = {}
+        
+        # Timer IDs count up from 1, so they are never reused
+        self._next_timer_id = 1
+        
+        # Running timers as (deadline_ns, timer ID, timer) tuples kept in a
+        # heap, so each loop only has to look at the timers that are due. The
+        # ID breaks ties in the order the timers were started. Stopped timers
+        # are marked dead, left in the heap, and skipped when they come up.
+        self._timer_heap = []
+        
+        # Functions bound to buttons with bind(), by (x, y)
+        self._btn_handlers = {}
     
     def setup(self):
         """Called when the game begins play"""
         
         self.playing = True
         self.stop_all_timers()
+        self._btn_handlers.clear()
     
     def cleanup(self):
         """Called when the game is quitting"""
@@ -55,14 +100,37 @@ class LaunchpadGame:
         button_event is a table: [x, y, down]
         x and y are the coordinates of the button on the launchpad and down is
         True if the button is being pressed down, false if it is released.
+        
+        By default, runs the function bound to the button with bind(), if any.
+        Call super().input(button_event) when overriding to keep this.
         """
-        pass
+        
+        handler = self._btn_handlers.get((button_event[0], button_event[1]))
+        if handler:
+            handler(button_event[2])
+    
+    def bind(self, x, y, function):
+        """Run a function whenever the button at (x, y) is pressed or released
+        
+        ***Do not override.***
+        Bindings are cleared by setup(), so make them in setup() after calling
+        super().setup().
+        :param x: x-coord of the button
+        :param y: y-coord of the button
+        :param function: Function to run, given True if the button was pressed
+        down and False if it was released. Replaces any function already bound
+        to the button.
+        """
+        
+        self._btn_handlers[(x, y)] = function
     
     def update(self):
-        """Called as fast as the game loop can execute
+        """Called once every loop
         
-        Use self.delta_time to get the duration of the last loop if you need
-        things to happen in real-world time.
+        The loop sleeps until the next fixed update or timer is due, waking up
+        early when a button is pressed, so this runs at least as often as
+        fixed_update(). Use self.delta_time to get the duration of the last
+        loop if you need things to happen in real-world time.
         """
         pass
     
@@ -81,49 +149,122 @@ class LaunchpadGame:
         
         Begins with setup(), then enters the main game loop, where the
         following occurs on a loop until playing is set to False:
+         - Handle all pending input
          - Measure time of last loop
-         - Hand input
          - Update game
          - Run fixed update if enough time has elapsed
-         - Draw any buffered led updates to launchpad (SLOW!)
+         - Run the functions of expired timers
+         - Draw any buffered led updates to launchpad (SLOW!), if there are any
+         - Sleep until the next fixed update or timer, or until input arrives
         Finally, once playing is false, run cleanup() and exit.
+        
+        Input is handled first so that the update, fixed update, timers and
+        drawing that follow in the same loop already see its effects, instead
+        of waiting for the next loop.
         """
         
         self.setup()
         
         # Begin timing
-        self.game_start_time = perf_counter()
-        self.delta()
+        self.game_start_time_ns = perf_counter_ns()
+        self.delta(self.game_start_time_ns)
+        
+        # Methods and objects used every loop, bound once so the loop doesn't
+        # look them up again each time
+        clock = perf_counter_ns
+        heap = self._timer_heap
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+        timers = self.timers
+        lp = self.lp
+        poll_events = self.lp.poll_events
+        button_state_xy = self.lp.button_state_xy
+        draw = self.lp.draw
+        wait_for_input = self.lp.wait_for_input
+        input_ = self.input
+        delta = self.delta
+        update = self.update
+        fixed_update = self.fixed_update
+        fixed_update_delay_ns = round(self.fixed_update_delay * NS_PER_SEC)
+        fixed_update_max_steps = self.fixed_update_max_steps
+        
+        # When the next fixed update is due
+        next_fixed = self.prev_time_ns + fixed_update_delay_ns
         
         while self.playing:
-            # Clock duration of last loop
-            self.delta()
+            # Handle every button event that arrived since the last loop, so
+            # presses made together all count in the same loop. Stop early if
+            # one of them quit the game.
+            poll_events()
+            button_event = button_state_xy()
+            while button_event and self.playing:
+                input_(button_event)
+                button_event = button_state_xy()
             
-            # Handle input
-            button_event = self.lp.button_state_xy()
-            if button_event:
-                self.input(button_event)
+            # Clock the start of this loop and the duration of the last one.
+            # The rest of the loop uses this one reading of the clock.
+            now = clock()
+            delta(now)
             
             # Update game
-            self.update()
+            update()
             
-            # If enough time elapsed, reset timer and run fixed_update()
-            self.fixed_update_timer += self.delta_time
-            if self.fixed_update_timer > self.fixed_update_delay:
-                self.fixed_update_timer -= self.fixed_update_delay
-                self.fixed_update()
+            # Run fixed_update() once for every fixed update that is due.
+            # Deadlines advance by exactly fixed_update_delay, so the rate
+            # doesn't drift.
+            if now >= next_fixed:
+                steps = 0
+                while now >= next_fixed and steps < fixed_update_max_steps:
+                    fixed_update()
+                    next_fixed += fixed_update_delay_ns
+                    steps += 1
+                
+                # After a long stall, drop the missed updates instead of
+                # trying to catch up on all of them
+                if now >= next_fixed:
+                    next_fixed = now + fixed_update_delay_ns
             
-            # Update timers elapsed time
-            for key in list(self.timers):
-                self.timers[key].update(self.delta_time)
+            # Run the timers that are due, in order of expiration
+            repeats = []
+            while heap and heap[0][0] <= now:
+                deadline, timer_id, timer = heappop(heap)
+                
+                # Skip timers that were stopped
+                if not timer.alive:
+                    continue
+                
+                if timer.function:
+                    timer.function(*timer.func_args)
+                
+                # The function may have stopped its own timer
+                if not timer.alive:
+                    continue
+                
+                # Reschedule after this loop, so a timer runs at most once per
+                # loop, or delete it if it's done
+                if timer.repeat:
+                    repeats.append((deadline + timer.expire_ns, timer_id,
+                                    timer))
+                else:
+                    timer.completed = True
+                    timer.alive = False
+                    del timers[timer_id]
             
-            # Delete if completed
-            to_del = [key for key in self.timers if self.timers[key].completed]
-            for key in to_del:
-                del self.timers[key]
+            for entry in repeats:
+                heappush(heap, entry)
             
-            # Draw to launchpad
-            self.lp.draw()
+            # Draw to launchpad, if anything this loop changed an LED
+            if lp.dirty:
+                draw()
+            
+            # Sleep until the next fixed update or timer is due (never longer
+            # than one fixed update), waking up early if a button is pressed
+            wake_time = next_fixed
+            if heap and heap[0][0] < wake_time:
+                wake_time = heap[0][0]
+            sleep_time = min(wake_time - clock(), fixed_update_delay_ns)
+            if sleep_time > 0 and self.playing:
+                wait_for_input(sleep_time / NS_PER_SEC)
         
         self.cleanup()
     
@@ -139,23 +280,70 @@ class LaunchpadGame:
         """
         
         timer = Timer(*args, expire=timeout, function=function, repeat=repeat)
-        self.timers[hash(timer)] = timer
-        return hash(timer)
+        return self._add_timer(timer, perf_counter_ns() + timer.expire_ns)
+    
+    def _add_timer(self, timer, deadline):
+        """Register a timer and schedule it to first expire at deadline
+        
+        :param timer: The Timer to add
+        :param deadline: When (perf_counter_ns time) the timer first expires
+        :return: The ID of the timer
+        """
+        
+        timer_id = self._next_timer_id
+        self._next_timer_id += 1
+        self.timers[timer_id] = timer
+        heapq.heappush(self._timer_heap, (deadline, timer_id, timer))
+        return timer_id
+    
+    def start_timers_bulk(self, *specs):
+        """Start many independent timers at once
+        
+        ***Do not override.***
+        Faster than calling start_timer for each one, since the timer heap is
+        rebuilt once at the end instead of being pushed to for every timer.
+        :param specs: Multiple tuples, each structured like a call to
+        start_timer: the function's args, then the function, the timeout, and
+        whether or not to repeat
+        :return: A list of the timer IDs, in the same order as specs
+        """
+        
+        start_time = perf_counter_ns()
+        timers = self.timers
+        heap = self._timer_heap
+        
+        # IDs are assigned in order, like start_timer would
+        first_id = self._next_timer_id
+        timer_ids = list(range(first_id, first_id + len(specs)))
+        self._next_timer_id = first_id + len(specs)
+        
+        for timer_id, spec in zip(timer_ids, specs):
+            *args, function, timeout, repeat = spec
+            timer = Timer(*args, expire=timeout, function=function,
+                          repeat=repeat)
+            timers[timer_id] = timer
+            heap.append((start_time + timer.expire_ns, timer_id, timer))
+        
+        heapq.heapify(heap)
+        return timer_ids
     
     def stop_timer(self, *timer_ids):
         """Stop and delete the currently running timers
         
         ***Do not override.***
         :param timer_ids: The IDs of the timers to stop
-        :return: True if a timer was found and deleted, False otherwise
+        :return: The number of timers that were found and deleted (0 if none)
         """
         
+        count = 0
         for timer_id in timer_ids:
-            if timer_id in self.timers:
-                del self.timers[timer_id]
-                return True
+            timer = self.timers.pop(timer_id, None)
+            if timer is not None:
+                # Its heap entry is dropped when it comes up
+                timer.alive = False
+                count += 1
         
-        return False
+        return count
     
     def stop_all_timers(self):
         """Stop and delete all running timers
@@ -166,7 +354,10 @@ class LaunchpadGame:
         
         # If there are timers, clear them
         if len(self.timers) > 0:
+            for timer in self.timers.values():
+                timer.alive = False
             self.timers.clear()
+            self._timer_heap.clear()
             return True
         
         return False
@@ -186,53 +377,70 @@ class LaunchpadGame:
         # For storing all of the IDs of the timers in the animation
         timer_ids = []
         
+        # The delay of each frame after the previous one, and the time of each
+        # frame since the start of the animation
+        delays = [tuple_[-1] for tuple_ in tuples]
+        frame_times = accumulate(delays)
+        
         # Store total animation time
-        total_time = 0
-        for tuple_ in tuples:
-            total_time += tuple_[-1]
+        total_time = sum(delays)
         
-        # The time of the last frame in the animation so far
-        running_time = 0
+        # All frames are timed from the same start
+        start_time = perf_counter_ns()
         
         # Create the timers with the same expiration time so they loop properly
-        for tuple_ in tuples:
-            # Update accumulated time from timers
-            running_time += tuple_[-1]
+        for tuple_, frame_time in zip(tuples, frame_times):
+            # Split the frame into its function args and function
+            *args, function, _ = tuple_
             
             # Create the timer
-            timer_id = self.start_timer(*tuple_[:-2],
-                                        function=tuple_[-2],
-                                        timeout=total_time,
-                                        repeat=repeat)
+            timer = Timer(*args,
+                          expire=total_time,
+                          function=function,
+                          repeat=repeat)
             
-            # Timers start with some time already elapsed so that they finish
-            # when specified in the arguments, despite having the same
-            # expiration time when created
-            self.timers[timer_id].passed = total_time - running_time
+            # Each frame first runs at its own time, then repeats with the
+            # period of the whole animation
+            timer_id = self._add_timer(timer, start_time
+                                       + round(frame_time * NS_PER_SEC))
             
             # Store ID to return at the end
             timer_ids.append(timer_id)
         
         return timer_ids
     
-    def delta(self):
+    def delta(self, cur_time=None):
         """Set delta_time equal to time since last call to delta()
         
         ***Do not override or call this method in a derived class.***
         It is used for timing the fixed update loop.
+        :param cur_time: The current perf_counter_ns() time, if it has already
+        been read
         """
         
-        cur_time = perf_counter()
-        self.delta_time = cur_time - self.prev_time
-        self.prev_time = cur_time
+        if cur_time is None:
+            cur_time = perf_counter_ns()
+        self.delta_time = (cur_time - self.prev_time_ns) / NS_PER_SEC
+        self.prev_time_ns = cur_time
     
     def get_time(self):
-        """Return the time since the game loop started
+        """Return the time since the game loop started, as of the start of
+        the current loop
         
         ***Do not override.***
+        Every call during a loop returns the same time. Use get_time_live() if
+        you need the exact current time.
         """
         
-        return perf_counter() - self.game_start_time
+        return (self.prev_time_ns - self.game_start_time_ns) / NS_PER_SEC
+    
+    def get_time_live(self):
+        """Return the exact time since the game loop started
+        
+        ***Do not override.***
+        """
+        
+        return (perf_counter_ns() - self.game_start_time_ns) / NS_PER_SEC
     
     def __str__(self):
         """Please override this with the name of the game"""
@@ -243,16 +451,13 @@ class LaunchpadGame:
 class Timer:
     """Defines a timer that runs a function with the given args after expiring
     
-    Can also be run on a loop. Must be updated with elapsed time to process
-    timing, run code, etc.
+    Can also be run on a loop. Timers are run by LaunchpadGame.play(), which
+    schedules them by deadline.
     """
     
-    passed = 0
-    expire = 0
-    repeat = False
-    function = None
-    func_args = []
-    completed = False
+    # Timers are created by the hundred, so keep them small and fast to read
+    __slots__ = ('expire_ns', 'repeat', 'function', 'func_args', 'completed',
+                 'alive')
     
     def __init__(self, *args, expire, function, repeat=False):
         """Creates a Timer
@@ -263,33 +468,12 @@ class Timer:
         :param repeat: Whether or not to repeat after expiring
         """
         
-        self.expire = expire
+        self.expire_ns = round(expire * NS_PER_SEC)
         self.function = function
         self.func_args = args
         self.repeat = repeat
-    
-    def update(self, t):
-        """Simulates an amount of time, updating and running code appropriately
-        
-        :param t: How much time to simulate
-        :return: True if timer is expired, false otherwise
-        """
-        # Increment time
-        self.passed += t
-        
-        # Check if timer expired
-        if not self.completed and self.passed > self.expire:
-            # Execute timer code
-            if self.function:
-                self.function(*self.func_args)
-            
-            # Reset time if set to repeat, mark complete otherwise
-            if self.repeat:
-                self.passed -= self.expire
-            else:
-                self.completed = True
-        
-        return self.completed
+        self.completed = False
+        self.alive = True  # False once stopped or completed
 
 
 def test():
@@ -303,11 +487,25 @@ def test():
     class TestGame(LaunchpadGame):
         """Test game that prints info and stops on any released button"""
         
-        num_updates = 0
-        num_fixed_updates = 0
+        __slots__ = ('num_updates', 'num_fixed_updates', 'loop_tmr',
+                     'timers100', 'random_led_index')
         
-        loop_tmr = None
-        timers100 = []
+        # Random leds (x, y, R, G) drawn in order by fixed_update(), picked
+        # ahead of time so that no random numbers are generated while playing
+        RANDOM_LEDS = [(random.randint(0, 8), random.randint(0, 8),
+                        random.randint(0, 3), random.randint(0, 3))
+                       for i in range(4096)]
+        
+        def __init__(self, launchpad_):
+            super().__init__(launchpad_)
+            
+            self.num_updates = 0
+            self.num_fixed_updates = 0
+            
+            self.loop_tmr = None
+            self.timers100 = []
+            
+            self.random_led_index = 0
         
         def setup(self):
             """Print that the game is setting up and make some timers"""
@@ -323,22 +521,22 @@ def test():
                                              repeat=True)
             
             # 100 looping timers that don't delete and 100 non-looping timers
+            specs = []
             for i in range(100):
                 string_ = 'Looper: ' + str(3 + i / 100000) + ' seconds'
-                self.start_timer(string_,
-                                 timeout=3 + i / 100000,
-                                 function=lambda x: print(x),
-                                 repeat=True)
-                id_ = self.start_timer('7 second timer: ' + str(i),
-                                       timeout=7,
-                                       function=lambda y: print(y))
-                self.timers100.append(id_)
+                specs.append((string_, lambda x: print(x), 3 + i / 100000,
+                              True))
+                specs.append(('7 second timer: ' + str(i), lambda y: print(y),
+                              7, False))
+            
+            # Every other timer is a non-looping one
+            self.timers100 = self.start_timers_bulk(*specs)[1::2]
             
             # Decimate the 100 non-looping timers
-            for i in range(100):
+            for i, id_ in enumerate(self.timers100):
                 if random.random() < 0.1:
                     print('Destroy 7 second timer', i)
-                    self.stop_timer(self.timers100[i])
+                    self.stop_timer(id_)
             
             print('Loop timer ID:', self.loop_tmr)
         
@@ -369,10 +567,9 @@ def test():
             # print('Num fixed updates:', self.num_fixed_updates)
             # print('Real time:', self.get_time())
             
-            self.lp.led_ctrl_xy(random.randint(0, 8),
-                                random.randint(0, 8),
-                                random.randint(0, 3),
-                                random.randint(0, 3))
+            self.lp.led_ctrl_xy(*self.RANDOM_LEDS[self.random_led_index])
+            self.random_led_index = ((self.random_led_index + 1)
+                                     % len(self.RANDOM_LEDS))
         
         def __str__(self):
             return 'TestGame'
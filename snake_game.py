@@ -3,13 +3,15 @@
 
 from launchpad import *
 from launchpad_game import LaunchpadGame
-from collections import deque
-from math import floor
 import enum
 
 
-class GameState(enum.Enum):
-    """Enum for representing the game's possible states from start to finish"""
+class GameState(enum.IntEnum):
+    """Enum for representing the game's possible states from start to finish
+    
+    States are ints in the order they are played, so a run of states can be
+    checked with a single range compare
+    """
     
     tutorial = 0
     starting = 1
@@ -18,12 +20,52 @@ class GameState(enum.Enum):
     show_score = 4
 
 
-class TileType(enum.Enum):
-    """Enum for representing the possible occupants of a tile on the board"""
+# States in which the quit button quits the game
+QUIT_STATES = frozenset((GameState.starting, GameState.snaking,
+                         GameState.show_score))
+
+
+def make_move_table(width, height, deltas):
+    """Returns where one step leads from every tile, wrapping around the edges
+    
+    :param width: Width of the board
+    :param height: Height of the board
+    :param deltas: Movements (dx, dy) to make tables for
+    :return: A tuple with a dict for each movement in deltas, mapping every
+    tile (x, y) on the board to the tile the movement leads to
+    """
+    
+    return tuple({(x, y): ((x + dx) % width, (y + dy) % height)
+                  for x in range(width) for y in range(height)}
+                 for dx, dy in deltas)
+
+
+def make_tile_indices(width, height):
+    """Returns the index of every tile, as used for board mask bits
+    
+    :param width: Width of the board
+    :param height: Height of the board
+    :return: A dict mapping every tile (x, y) to x * height + y, in order of
+    index
+    """
+    
+    return {(x, y): x * height + y
+            for x in range(width) for y in range(height)}
+
+
+def make_button_bits(buttons, tile_index):
+    """Returns the board mask bit under each grid button, by direction
+    
+    :param buttons: Dict of lists of grid button coordinates, by direction
+    :param tile_index: Dict mapping each tile (x, y) to its index
+    :return: A dict with a tuple of the bits under each direction's buttons,
+    in the same order as the buttons
+    """
     
-    empty = 0
-    snake = 1
-    food = 2
+    # Grid buttons are one row below the tile they show (the top row of
+    # Launchpad buttons isn't part of the board)
+    return {direction: tuple(1 << tile_index[(x, y - 1)] for x, y in coords)
+            for direction, coords in buttons.items()}
 
 
 def is_opposite_dir(dir1, dir2):
@@ -32,20 +74,16 @@ def is_opposite_dir(dir1, dir2):
     :return: True if opposite directions, False otherwise
     """
     
-    if dir1 is Direction.up and dir2 is Direction.down:
-        return True
-    if dir1 is Direction.down and dir2 is Direction.up:
-        return True
-    if dir1 is Direction.left and dir2 is Direction.right:
-        return True
-    if dir1 is Direction.right and dir2 is Direction.left:
-        return True
-    
-    return False
+    # Opposite directions only differ in the lowest bit
+    return dir1 ^ dir2 == 1
 
 
-class Direction(enum.Enum):
-    """Enum for representing the possible directions for the snake to move"""
+class Direction(enum.IntEnum):
+    """Enum for representing the possible directions for the snake to move
+    
+    Directions are ints, so they can index tables directly. Opposite
+    directions must only differ in the lowest bit.
+    """
     
     up = 0
     down = 1
@@ -120,6 +158,9 @@ class SnakeGame(LaunchpadGame):
         Direction.left: LEFT_BUTTONS,
         Direction.right: RIGHT_BUTTONS
     }
+    BUTTON_TO_DIR = {coord: direction
+                     for direction, coords in GRID_BUTTONS.items()
+                     for coord in coords}  # Direction of each grid button
     ARROW_BUTTONS = {
         Direction.up: (0, 0),
         Direction.down: (1, 0),
@@ -150,11 +191,14 @@ class SnakeGame(LaunchpadGame):
     TIM_SNAKE_FLASH = 0.075
     TIM_SHOW_SCORE = 0.04
     tmr_snake = 0
+    tutorial_parts = None  # Cached tutorial animations, see tutorial()
     
-    # Game board
+    # Game board, as one bitmask of the tiles holding snake and one of the
+    # tiles holding food. The tile at (x, y) is bit x * BOARD_HEIGHT + y
     BOARD_WIDTH = 8
     BOARD_HEIGHT = 8
-    board = [[]]
+    snake_mask = 0
+    food_mask = 0
     
     # Snake variables
     SNAKE_SPD = 3.2  # Squares per second
@@ -165,8 +209,40 @@ class SnakeGame(LaunchpadGame):
     snake_loc = INIT_SNAKE_LOC
     snake_dir = INIT_SNAKE_DIR
     snake_len = INIT_SNAKE_LEN
-    snake_body = deque()
-    dir_buffer = deque()
+    
+    # Buffered direction changes as 2-bit direction values packed into an
+    # int, oldest in the lowest bits
+    DIR_BUFFER_SIZE = 4  # Most turns that can be buffered at once
+    DIRECTIONS = tuple(Direction)  # Direction of each value
+    dir_buffer = 0
+    dir_buffer_len = 0
+    
+    # Snake body as a ring buffer of tile indices. The head is at snake_head_i
+    # and segment i behind it is at snake_head_i - i (negative indices wrap
+    # around to the end of the ring)
+    snake_ring = bytearray()
+    snake_head_i = 0
+    snake_body_len = 0
+    
+    # Movement (dx, dy) for each direction, indexed by Direction
+    DIR_DELTA = (
+        (0, -1),  # Up
+        (0, 1),  # Down
+        (-1, 0),  # Left
+        (1, 0)  # Right
+    )
+    
+    # Tile the snake moves to from each tile, by direction, the index
+    # of each tile (its bit in the board masks), and the tile at each index
+    NEXT_LOC = make_move_table(BOARD_WIDTH, BOARD_HEIGHT, DIR_DELTA)
+    TILE_INDEX = make_tile_indices(BOARD_WIDTH, BOARD_HEIGHT)
+    TILE_LOC = tuple(TILE_INDEX)
+    
+    # Board mask bit under each grid button (parallel to GRID_BUTTONS) and
+    # all of a direction's bits together
+    GRID_BUTTON_BITS = make_button_bits(GRID_BUTTONS, TILE_INDEX)
+    GRID_BUTTON_MASKS = {direction: sum(bits)
+                         for direction, bits in GRID_BUTTON_BITS.items()}
     
     # Food variables
     FOOD_VALUE = 1
@@ -180,20 +256,29 @@ class SnakeGame(LaunchpadGame):
         
         self.lp.reset()
         
-        # Snake setup
-        self.snake_loc = self.INIT_SNAKE_LOC
+        # Snake setup (the starting location may be just off the board, it's
+        # wrapped so that the first move lands on the right tile)
+        self.snake_loc = (self.INIT_SNAKE_LOC[0] % self.BOARD_WIDTH,
+                          self.INIT_SNAKE_LOC[1] % self.BOARD_HEIGHT)
         self.snake_len = self.INIT_SNAKE_LEN
         self.snake_dir = self.INIT_SNAKE_DIR
-        self.snake_body = deque()
-        self.dir_buffer = deque()
+        self.snake_ring = bytearray(self.BOARD_WIDTH * self.BOARD_HEIGHT)
+        self.snake_head_i = 0
+        self.snake_body_len = 0
+        self.dir_buffer = 0
+        self.dir_buffer_len = 0
         
         # Food setup
         self.food_loc = self.INIT_FOOD_LOC
         
         # Board setup
-        self.board = [[TileType.empty for i in range(self.BOARD_WIDTH)]
-                      for j in range(self.BOARD_HEIGHT)]
-        self.board[self.food_loc[0]][self.food_loc[1]] = TileType.food
+        self.snake_mask = 0
+        self.food_mask = 1 << (self.food_loc[0] * self.BOARD_HEIGHT
+                               + self.food_loc[1])
+        
+        # Menu buttons
+        self.bind(*self.BUT_QUIT, self.quit_button)
+        self.bind(*self.BUT_RESTART, self.restart_button)
         
         # Initial state
         self.change_state(GameState.tutorial)
@@ -215,76 +300,86 @@ class SnakeGame(LaunchpadGame):
         
         super().input(button_event)
         
-        if self.state in [GameState.starting, GameState.snaking]:
+        # Starting or snaking
+        if GameState.starting <= self.state <= GameState.snaking:
             x = button_event[0]
             y = button_event[1]
             
             # If button pressed down
             if button_event[2]:
-                # Directional input
-                for direction in Direction:
-                    # Grid buttons
-                    if (x, y) in self.GRID_BUTTONS[direction]:
-                        # Buffer direction change
-                        self.try_dir_change(direction)
-                        
-                        # Color whole button field for a short interval of time
-                        self.draw_grid_buttons(direction, True)
-                        self.start_timer(direction, False,
-                                         function=self.draw_grid_buttons,
-                                         timeout=self.TIM_GRID_BUTTONS)
-                        
-                        # If waiting to begin play and a valid direction was
-                        # pressed, begin the game
-                        if self.state is GameState.starting:
-                            if not is_opposite_dir(direction, self.snake_dir):
-                                self.change_state(GameState.snaking)
-            
-            # If button released
-            if not button_event[2]:
-                # Quit button
-                if (x, y) == self.BUT_QUIT:
-                    self.playing = False
+                # Directional input from grid buttons
+                direction = self.BUTTON_TO_DIR.get((x, y))
+                if direction is not None:
+                    # Buffer direction change
+                    self.try_dir_change(direction)
+                    
+                    # Color whole button field for a short interval of time
+                    self.draw_grid_buttons(direction, True)
+                    self.start_timer(direction, False,
+                                     function=self.draw_grid_buttons,
+                                     timeout=self.TIM_GRID_BUTTONS)
+                    
+                    # If waiting to begin play and a valid direction was
+                    # pressed, begin the game
+                    if self.state is GameState.starting:
+                        if not is_opposite_dir(direction, self.snake_dir):
+                            self.change_state(GameState.snaking)
+    
+    def quit_button(self, down):
+        """Quit when the quit button is released, unless in the tutorial
         
-        if self.state is GameState.show_score:
-            x = button_event[0]
-            y = button_event[1]
-            
-            # If button released
-            if not button_event[2]:
-                # Quit button
-                if (x, y) == self.BUT_QUIT:
-                    self.playing = False
-                
-                # Restart button
-                if (x, y) == self.BUT_RESTART:
-                    self.setup(restart=True)
+        :param down: True if the button was pressed, False if released
+        """
+        
+        if not down and self.state in QUIT_STATES:
+            self.playing = False
+    
+    def restart_button(self, down):
+        """Restart when the restart button is released on the score screen
+        
+        :param down: True if the button was pressed, False if released
+        """
+        
+        if not down and self.state is GameState.show_score:
+            self.setup(restart=True)
     
     def update_snake(self):
         """Performs one move for the snake, checking for food and collision"""
         
         # Get next direction from buffer
-        if len(self.dir_buffer) > 0:
-            self.snake_dir = self.dir_buffer.pop()
+        if self.dir_buffer_len > 0:
+            self.snake_dir = self.DIRECTIONS[self.dir_buffer & 3]
+            self.dir_buffer >>= 2
+            self.dir_buffer_len -= 1
         
         if not self.move_snake():
             # Move didn't go so well, time to die
             self.change_state(GameState.dying)
             return
         
+        ring = self.snake_ring
+        
         # Update snake head
-        self.snake_body.appendleft(self.snake_loc)
-        x = self.snake_loc[0]
-        y = self.snake_loc[1]
-        self.board[x][y] = TileType.snake
+        head_tile = self.TILE_INDEX[self.snake_loc]
+        head_i = (self.snake_head_i + 1) % len(ring)
+        ring[head_i] = head_tile
+        self.snake_head_i = head_i
+        snake_mask = self.snake_mask | 1 << head_tile
+        
+        # Update snake tail and erase it, or grow if it's not long enough
+        # (the ring is as big as the board, so the body always fits in it)
+        prev_len = self.snake_body_len
+        if prev_len >= self.snake_len:
+            tail_tile = ring[head_i - prev_len]
+            snake_mask &= ~(1 << tail_tile)
+            tail_x, tail_y = self.TILE_LOC[tail_tile]
+            self.lp.led_ctrl_xy(tail_x, tail_y + 1, *K)
+        else:
+            self.snake_body_len = prev_len + 1
         
-        # Update snake tail and erase it
-        if len(self.snake_body) > self.snake_len:
-            tail = self.snake_body.pop()
-            self.board[tail[0]][tail[1]] = TileType.empty
-            self.lp.led_ctrl_xy(tail[0], tail[1] + 1, *K)
+        self.snake_mask = snake_mask
         
-        self.draw_snake()
+        self.draw_snake_moved(prev_len)
     
     def move_snake(self):
         """Move the snake's head and check for obstacles
@@ -294,38 +389,23 @@ class SnakeGame(LaunchpadGame):
         if obstacle is hit and death is imminent
         """
         
-        # Find where snake is trying to move
-        target_loc = [self.snake_loc[0], self.snake_loc[1]]
-        if self.snake_dir is Direction.up:
-            target_loc[1] -= 1
-        elif self.snake_dir is Direction.down:
-            target_loc[1] += 1
-        elif self.snake_dir is Direction.left:
-            target_loc[0] -= 1
-        elif self.snake_dir is Direction.right:
-            target_loc[0] += 1
-        
-        # Wrap around
-        if target_loc[0] < 0:
-            target_loc[0] = self.BOARD_WIDTH - 1
-        if target_loc[0] >= self.BOARD_WIDTH:
-            target_loc[0] = 0
-        if target_loc[1] < 0:
-            target_loc[1] = self.BOARD_HEIGHT - 1
-        if target_loc[1] >= self.BOARD_HEIGHT:
-            target_loc[1] = 0
+        # Find where snake is trying to move, wrapping around the edges
+        target_loc = self.NEXT_LOC[self.snake_dir][self.snake_loc]
+        
+        # Check what's in the way
+        tile_bit = 1 << self.TILE_INDEX[target_loc]
         
         # Check for snake
-        if self.board[target_loc[0]][target_loc[1]] is TileType.snake:
+        if self.snake_mask & tile_bit:
             # No movement, just death
             return False
         
         # Check for delicious food
-        if self.board[target_loc[0]][target_loc[1]] is TileType.food:
+        if self.food_mask & tile_bit:
             self.eat_food()
         
         # Make the move
-        self.snake_loc = (target_loc[0], target_loc[1])
+        self.snake_loc = target_loc
         return True
     
     def eat_food(self):
@@ -333,24 +413,31 @@ class SnakeGame(LaunchpadGame):
         
         self.snake_len += self.FOOD_VALUE
         
-        # Find a spot for the delicious food
-        new_x = -1
-        new_y = -1
-        is_bad_loc = True
-        while is_bad_loc:
-            # Pick a random tile
-            new_x = random.randint(0, self.BOARD_WIDTH - 1)
-            new_y = random.randint(0, self.BOARD_HEIGHT - 1)
-            
-            # Make sure its empty
-            is_bad_loc = self.board[new_x][new_y] is not TileType.empty
-        
-        # Move the delicious food
+        # Remove the eaten food (no need to erase it, the snake's head is
+        # drawn over it in the same move)
         old_x = self.food_loc[0]
         old_y = self.food_loc[1]
-        self.board[old_x][old_y] = TileType.empty
-        self.lp.led_ctrl_xy(old_x, old_y + 1, *K)
-        self.board[new_x][new_y] = TileType.food
+        self.food_mask = 0
+        
+        # Every tile that is free for the delicious food
+        num_tiles = self.BOARD_WIDTH * self.BOARD_HEIGHT
+        free = ~(self.snake_mask | (1 << (old_x * self.BOARD_HEIGHT + old_y)))
+        free &= (1 << num_tiles) - 1
+        
+        # No room left, the snake fills the whole board
+        num_free = bin(free).count('1')
+        if num_free == 0:
+            return
+        
+        # Pick one of the free tiles at random by clearing the lowest free
+        # tiles before it, so there's never a need to retry
+        for i in range(random.randrange(num_free)):
+            free &= free - 1
+        tile = (free & -free).bit_length() - 1
+        new_x, new_y = divmod(tile, self.BOARD_HEIGHT)
+        
+        # Move the delicious food
+        self.food_mask = 1 << tile
         self.lp.led_ctrl_xy(new_x, new_y + 1, *self.COL_FOOD)
         self.food_loc = (new_x, new_y)
     
@@ -360,28 +447,74 @@ class SnakeGame(LaunchpadGame):
         :param direction: Direction to turn in
         """
         
+        buffer_len = self.dir_buffer_len
+        
+        # Ignore the turn if the buffer is full
+        if buffer_len >= self.DIR_BUFFER_SIZE:
+            return
+        
         # Store the current direction or last direction buffered
-        if len(self.dir_buffer) > 0:
-            prev_dir = self.dir_buffer[0]
+        if buffer_len > 0:
+            prev_dir = self.DIRECTIONS[self.dir_buffer >> 2 * (buffer_len - 1)]
         else:
             prev_dir = self.snake_dir
         
         # Do not buffer if same direction or opposite direction as previous
         if direction is not prev_dir:
             if not is_opposite_dir(direction, prev_dir):
-                self.dir_buffer.appendleft(direction)
+                self.dir_buffer |= direction << 2 * buffer_len
+                self.dir_buffer_len = buffer_len + 1
+    
+    def snake_body_locs(self):
+        """Returns a list of the body's tiles (x, y), from head to tail"""
+        
+        ring = self.snake_ring
+        head_i = self.snake_head_i
+        tile_loc = self.TILE_LOC
+        
+        return [tile_loc[ring[head_i - i]] for i in range(self.snake_body_len)]
     
     def draw_snake(self):
         """Draws everything in snake body to the board"""
         
-        for i in range(len(self.snake_body)):
-            # Launchpad led coords
-            x = self.snake_body[i][0]
-            y = self.snake_body[i][1] + 1
-            
-            # Draw color from COL_SNAKE gradient
-            color_id = floor(i / len(self.snake_body) * len(self.COL_SNAKE))
-            self.lp.led_ctrl_xy(x, y, *self.COL_SNAKE[color_id])
+        length = self.snake_body_len
+        colors = self.COL_SNAKE
+        num_colors = len(colors)
+        led_ctrl_xy = self.lp.led_ctrl_xy
+        
+        for i, (x, y) in enumerate(self.snake_body_locs()):
+            # Draw color from COL_SNAKE gradient (launchpad y is one lower)
+            led_ctrl_xy(x, y + 1, *colors[i * num_colors // length])
+    
+    def draw_snake_moved(self, prev_len):
+        """Draws the parts of the snake that changed color after one move
+        
+        Every segment moves down the body by one, so only the new head and the
+        segments that crossed into another color of the COL_SNAKE gradient
+        need drawing. Color k starts at segment ceil(k * length / colors),
+        which moves by at most one segment when the snake grows.
+        :param prev_len: Length of the snake body before the move
+        """
+        
+        ring = self.snake_ring
+        head_i = self.snake_head_i
+        tile_loc = self.TILE_LOC
+        colors = self.COL_SNAKE
+        led_ctrl_xy = self.lp.led_ctrl_xy
+        length = self.snake_body_len
+        num_colors = len(colors)
+        
+        # The head, then the first segment of each color before and after
+        # the boundary moved
+        to_draw = {0}
+        for k in range(1, num_colors):
+            to_draw.add(-(-k * length // num_colors))
+            to_draw.add(-(-k * prev_len // num_colors) + 1)
+        
+        for i in to_draw:
+            if i < length:
+                x, y = tile_loc[ring[head_i - i]]
+                led_ctrl_xy(x, y + 1, *colors[i * num_colors // length])
     
     def change_state(self, new_state):
         """Transitions the game's state to the given state
@@ -392,41 +525,48 @@ class SnakeGame(LaunchpadGame):
         :return: True if there was a state transition, False otherwise
         """
         
-        state_transition = self.state is new_state
+        state_transition = self.state is not new_state
         self.state = new_state
         
-        if self.state is GameState.starting:
-            # Show the quit button
-            self.lp.led_ctrl_xy(*self.BUT_QUIT, *self.COL_QUIT)
+        # Run the state's entry functionality, if it has any
+        enter = self.STATE_ENTRY.get(new_state)
+        if enter is not None:
+            enter(self)
         
-        elif self.state is GameState.snaking:
-            # Start the real game with a snake update timer
-            self.tmr_snake = self.start_timer(function=self.update_snake,
-                                              timeout=self.SNAKE_UPDATE_DELAY,
-                                              repeat=True)
+        return state_transition
+    
+    def enter_starting(self):
+        """Shows the quit button when entering the starting state"""
         
-        elif self.state is GameState.dying:
-            self.stop_timer(self.tmr_snake)
-            
-            # Flashy snake death animation
-            anim = [(None, self.TIM_SNAKE_FLASH)]
-            for i in range(len(self.snake_body)):
-                coords = self.snake_body[i]
-                anim.append((coords[0], coords[1] + 1, *K,
-                             self.lp.led_ctrl_xy, 0))
-                anim.append((coords[0], coords[1] + 1, *self.COL_DEAD_SNAKE,
-                             self.lp.led_ctrl_xy, self.TIM_SNAKE_FLASH))
-            
-            # Change state to score display
-            anim.append((GameState.show_score,
-                         self.change_state, 5 * self.TIM_SNAKE_FLASH))
-            
-            self.start_anim(*anim)
+        self.lp.led_ctrl_xy(*self.BUT_QUIT, *self.COL_QUIT)
+    
+    def enter_snaking(self):
+        """Starts the real game with a snake update timer"""
+        
+        self.tmr_snake = self.start_timer(function=self.update_snake,
+                                          timeout=self.SNAKE_UPDATE_DELAY,
+                                          repeat=True)
+    
+    def enter_dying(self):
+        """Stops the snake and plays its death animation, which then changes
+        to the show_score state
+        """
         
-        elif self.state is GameState.show_score:
-            self.show_score()
+        self.stop_timer(self.tmr_snake)
         
-        return state_transition
+        # Flashy snake death animation
+        anim = [(None, self.TIM_SNAKE_FLASH)]
+        for coords in self.snake_body_locs():
+            anim.append((coords[0], coords[1] + 1, *K,
+                         self.lp.led_ctrl_xy, 0))
+            anim.append((coords[0], coords[1] + 1, *self.COL_DEAD_SNAKE,
+                         self.lp.led_ctrl_xy, self.TIM_SNAKE_FLASH))
+        
+        # Change state to score display
+        anim.append((GameState.show_score,
+                     self.change_state, 5 * self.TIM_SNAKE_FLASH))
+        
+        self.start_anim(*anim)
     
     def tutorial(self, input_tutorial=True):
         """Displays the tutorial and advances to starting state
@@ -437,6 +577,30 @@ class SnakeGame(LaunchpadGame):
         illuminates the directional input buttons
         """
         
+        # The animation only changes with food_loc, so the rest of it is
+        # built once per game object and reused
+        if self.tutorial_parts is None:
+            self.tutorial_parts = {}
+        parts = self.tutorial_parts.get(input_tutorial)
+        if parts is None:
+            parts = self.build_tutorial(input_tutorial)
+            self.tutorial_parts[input_tutorial] = parts
+        
+        # Show food while the snake turns
+        food = (self.food_loc[0], self.food_loc[1] + 1, *self.COL_FOOD,
+                self.lp.led_ctrl_xy, 0)
+        
+        self.start_anim(*parts[0], food, *parts[1])
+    
+    def build_tutorial(self, input_tutorial):
+        """Builds the tutorial animation, except for showing the food
+        
+        :param input_tutorial: If True, include the portion of the tutorial
+        that illuminates the directional input buttons
+        :return: The animation frames before and after the food is shown, as
+        two tuples
+        """
+        
         # Tutorial animation
         anim = []
         
@@ -479,11 +643,9 @@ class SnakeGame(LaunchpadGame):
         for i in range(7):
             anim.append((self.update_snake, self.TIM_TUTORIAL_SNAKE))
         
-        # Show food and turn snake
-        anim.append((self.food_loc[0], self.food_loc[1] + 1, *self.COL_FOOD,
-                     self.lp.led_ctrl_xy, 0))
-        anim.append((Direction.right,
-                     self.try_dir_change, 0))
+        # The food is shown here (see tutorial()), then the snake turns
+        head = tuple(anim)
+        anim = [(Direction.right, self.try_dir_change, 0)]
         
         # Make snake move forward 2 more times
         for i in range(2):
@@ -493,7 +655,7 @@ class SnakeGame(LaunchpadGame):
         anim.append((GameState.starting,
                      self.change_state, self.SNAKE_UPDATE_DELAY))
         
-        self.start_anim(*anim)
+        return head, tuple(anim)
     
     def show_score(self):
         """Display an animation of the snake filling the screen
@@ -512,21 +674,33 @@ class SnakeGame(LaunchpadGame):
         # The maximum score is the board's total number of tiles
         score = min(self.snake_len, self.BOARD_WIDTH * self.BOARD_HEIGHT)
         
-        # Final snake length display animation
-        anim = [(None, 8 * self.TIM_SHOW_SCORE)]
-        for i in range(score):
-            x = i % self.BOARD_WIDTH
-            y = i // self.BOARD_WIDTH + 1
-            
-            # Light up in food color, then blink to snake color
-            anim.append((x, y, *self.COL_FOOD,
-                         self.lp.led_ctrl_xy, 0))
-            anim.append((x, y, *self.COL_SNAKE[0],
-                         self.lp.led_ctrl_xy, self.TIM_SHOW_SCORE))
+        # Final snake length display animation, one frame per tile plus one
+        # to finish the last tile
+        anim = [(0, score, self.draw_score_step, 8 * self.TIM_SHOW_SCORE)]
+        for i in range(1, score + 1):
+            anim.append((i, score, self.draw_score_step, self.TIM_SHOW_SCORE))
         
         # Play score animation on loop
         self.start_anim(*anim, repeat=True)
     
+    def draw_score_step(self, i, score):
+        """Draws one frame of the score animation
+        
+        Each tile lights up in food color, then blinks to snake color in the
+        same frame as the next tile lights up.
+        
+        :param i: Index of the tile lighting up this frame
+        :param score: Number of tiles in the animation
+        """
+        
+        width = self.BOARD_WIDTH
+        
+        if i > 0:
+            self.lp.led_ctrl_xy((i - 1) % width, (i - 1) // width + 1,
+                                *self.COL_SNAKE[0])
+        if i < score:
+            self.lp.led_ctrl_xy(i % width, i // width + 1, *self.COL_FOOD)
+    
     def draw_grid_buttons(self, direction, is_on):
         """Draws the grid buttons for the selected direction on or off
         
@@ -535,24 +709,28 @@ class SnakeGame(LaunchpadGame):
         """
         
         if is_on:
-            for coord in self.GRID_BUTTONS[direction]:
-                self.lp.led_ctrl_xy(*coord, *self.COL_GRID)
+            self.lp.led_ctrl_xy_multi(self.GRID_BUTTONS[direction],
+                                      *self.COL_GRID)
         else:
             # Draw snake
             self.draw_snake()
             
-            # Draw everything else
-            for coord in self.GRID_BUTTONS[direction]:
-                x = coord[0]
-                y = coord[1]
-                
-                # Draw food
-                if self.board[x][y - 1] is TileType.food:
-                    self.lp.led_ctrl_xy(*coord, *self.COL_FOOD)
-                
-                # Draw empty
-                if self.board[x][y - 1] is TileType.empty:
-                    self.lp.led_ctrl_xy(*coord, *K)
+            # Find the food and empty tiles under the buttons, all at once
+            mask = self.GRID_BUTTON_MASKS[direction]
+            food = mask & self.food_mask
+            empty = mask & ~(self.snake_mask | self.food_mask)
+            
+            # Draw each color at once
+            coords = self.GRID_BUTTONS[direction]
+            bits = self.GRID_BUTTON_BITS[direction]
+            if food:
+                self.lp.led_ctrl_xy_multi(
+                    [coord for coord, bit in zip(coords, bits) if food & bit],
+                    *self.COL_FOOD)
+            if empty:
+                self.lp.led_ctrl_xy_multi(
+                    [coord for coord, bit in zip(coords, bits) if empty & bit],
+                    *K)
     
     def draw_arrow_buttons(self, direction, is_on):
         """Draws the arrow button for the selected direction on or off
@@ -568,6 +746,14 @@ class SnakeGame(LaunchpadGame):
             self.lp.led_ctrl_xy(*self.ARROW_BUTTONS[direction],
                                 *K)
     
+    # Entry functionality run by change_state() for each state
+    STATE_ENTRY = {
+        GameState.starting: enter_starting,
+        GameState.snaking: enter_snaking,
+        GameState.dying: enter_dying,
+        GameState.show_score: show_score
+    }
+    
     def __str__(self):
         return 'SnakeGame'
 
@@ -0,0 +1,83 @@
+# Author
+# William Lucca
+
+import unittest
+
+try:
+    from launchpad import *
+except ImportError:  # pygame isn't installed
+    Launchpad = None
+
+
+class FakeDevice:
+    """Stands in for Launchpad.midi and keeps the LED colors a Launchpad would
+    show after the messages it was sent, in rapid update order
+    """
+    
+    def __init__(self):
+        self.leds = bytearray(RAPID_LED_COUNT)
+        self.cursor = 0  # Next LED of a rapid update
+    
+    def RawWrite(self, stat, dat1, dat2):
+        if stat == 146:
+            # Rapid update, two LEDs at a time
+            for led in (dat1, dat2):
+                if self.cursor < RAPID_LED_COUNT:
+                    self.leds[self.cursor] = led
+                self.cursor += 1
+            return
+        
+        # Any other message restarts the rapid update
+        self.cursor = 0
+        
+        if stat == 176 and dat1 == 0:
+            if dat2 == 0:
+                self.leds[:] = bytes(RAPID_LED_COUNT)  # Reset
+        elif stat == 176:
+            self.leds[72 + dat1 - 104] = dat2  # Automap LED
+        elif stat == 144:
+            x = dat1 & 0x0f
+            y = dat1 >> 4
+            self.leds[(y << 3) | x if x < 8 else 64 + y] = dat2
+    
+    def WriteBatch(self, msgs):
+        for msg in msgs:
+            self.RawWrite(*msg)
+
+
+@unittest.skipIf(Launchpad is None, 'pygame is not installed')
+class RapidUpdateTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.lp = Launchpad()
+        self.device = FakeDevice()
+        self.lp.midi = self.device
+        self.lp.reset()
+    
+    def assertDeviceMatchesShadow(self):
+        self.assertEqual(self.device.leds, self.lp._led_shadow)
+    
+    def test_queued_write_before_rapid_frame(self):
+        # Queue a write, then cover its LED with a rapid frame
+        self.lp.led_ctrl_xy(2, 1, 0, 3)
+        self.lp.led_ctrl_raw_rapid([3] * RAPID_LED_COUNT)
+        self.lp.draw()
+        self.assertDeviceMatchesShadow()
+        
+        # Writing the queued color again must reach the LED
+        self.lp.led_ctrl_xy(2, 1, 0, 3)
+        self.lp.draw()
+        self.assertEqual(self.device.leds[2], 0x30)
+        self.assertDeviceMatchesShadow()
+    
+    def test_queued_write_past_short_rapid_frame(self):
+        # A write to an LED the frame doesn't reach still goes out
+        self.lp.led_ctrl_xy(8, 7, 3, 3)
+        self.lp.led_ctrl_raw_rapid([1] * 10)
+        self.lp.draw()
+        self.assertEqual(self.device.leds[70], 0x33)
+        self.assertDeviceMatchesShadow()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,15 @@
 # William Lucca
 
 from launchpad import *
-from random import randint
+from random import getrandbits
 import math
 
 
 class TileFlipGame:
     # Game variables
-    LOOP_DELAY = 10
+    LOOP_DELAY = 100  # Longest wait for input between loops (ms)
+    QUIT_LOOP_DELAY = 16  # Same, while the quit button is blinking (ms)
+    IDLE_INPUT_SLICE = 25  # Time between input checks while idle (ms)
     
     # Board variables
     INIT_WIDTH = 4
@@ -22,7 +24,19 @@ class TileFlipGame:
     boardHeightMin = 0
     boardHeightMax = 0
     
-    board = [[]]
+    # Buttons around the grid: top row and right column, minus quit (8, 8)
+    OUTSIDE_BUTTONS = ([(i, 0) for i in range(0, 8)]
+                       + [(8, j) for j in range(1, 8)])
+    
+    # Tile states as bits of an int, the tile at x, y (in board coordinates)
+    # is bit x * 8 + y and is set if the tile is on
+    board = 0
+    fullMask = 0  # The board with every tile on, see fullBoard()
+    maskSize = (0, 0)  # Board dimensions fullMask and flipMasks were built for
+    
+    # Board bits flipped by pressing each tile, by tile (in launchpad
+    # coordinates)
+    flipMasks = {}
     
     # Game cover art
     R = (3, 0)
@@ -64,16 +78,19 @@ class TileFlipGame:
         
         # Query buttons via the "xy return strategy" until game is won or quit
         while True:
-            self.lp.draw()
-            time.wait(self.LOOP_DELAY)
-            but = self.lp.button_state_xy()
+            self.lp.draw_rapid()
+            self.waitForInput(quitting)
             
             # Animations
             if quitting:
                 self.quitAnimation()
             
-            # When a button is pressed down...
-            if but != [] and but[2]:
+            # Handle every button event since the last loop
+            for but in self.drainEvents():
+                
+                # When a button is pressed down...
+                if not but[2]:
+                    continue
                 
                 # Call tilePress function on the pressed button
                 if self.tilePress(but[0], but[1]):
@@ -81,17 +98,18 @@ class TileFlipGame:
                     # If a tile was flipped, check for completed board
                     if self.checkWin():
                         self.win()
-                        break
+                        return
                 
                 # Check if quit button was pressed
                 if but == [8, 8, True]:
                     if quitting:
                         # Second time quit button is pressed
                         self.quitGame()
-                        break
+                        return
                     else:
                         # First time quit button is pressed
                         quitting = True
+                        self.quitIntensity = -1
                 else:
                     # Pending quit has been canceled
                     quitting = False
@@ -114,16 +132,21 @@ class TileFlipGame:
         # Allow user to select their board size
         self.lp.open_input()
         # Query buttons until "continue" (Solo) is pressed or game is quit
-        while True:
-            self.lp.draw()
-            time.wait(self.LOOP_DELAY)
-            but = self.lp.button_state_xy()
+        ready = False
+        while not ready:
+            self.lp.draw_rapid()
+            self.waitForInput(quitting)
             
             # Animations
             if quitting: self.quitAnimation()
             
-            # When a button is pressed down...
-            if but != [] and but[2] == True:
+            # Handle every button event since the last loop
+            for but in self.drainEvents():
+                
+                # When a button is pressed down...
+                if not but[2]:
+                    continue
+                
                 if but[1] == 0 and 0 <= but[0] <= 3:
                     # Change size based on button pressed
                     self.dimensionChange(but[0])
@@ -132,6 +155,7 @@ class TileFlipGame:
                 
                 if but == [8, 7, True]:
                     # Continue to game
+                    ready = True
                     break
                 
                 # Check if quit button was pressed
@@ -143,14 +167,14 @@ class TileFlipGame:
                     else:
                         # First time quit button is pressed
                         quitting = True
+                        self.quitIntensity = -1
                 else:
                     # Pending quit has been canceled
                     quitting = False
                     self.lp.led_ctrl_xy(8, 8, 3, 0)
         
-        # Make outside leds green
-        [self.lp.led_ctrl_xy(i, 0, 0, 3) for i in range(0, 8)]
-        [self.lp.led_ctrl_xy(8, j, 0, 3) for j in range(1, 9)]
+        # Make outside leds green, except the quit button
+        self.lp.led_ctrl_xy_multi(self.OUTSIDE_BUTTONS, 0, 3)
         
         # Make quit button red
         self.lp.led_ctrl_xy(8, 8, 3, 0)
@@ -159,6 +183,28 @@ class TileFlipGame:
         
         return True
     
+    # Sleep until a button event arrives, waking up sooner to animate the quit
+    # button if quitting. While idle, input is checked less often so the board
+    # wakes up as little as possible.
+    def waitForInput(self, quitting):
+        if quitting:
+            self.lp.wait_for_input(self.QUIT_LOOP_DELAY / 1000)
+        else:
+            self.lp.wait_for_input(self.LOOP_DELAY / 1000,
+                                   self.IDLE_INPUT_SLICE / 1000)
+    
+    # Return every button event waiting in the MIDI input, oldest first
+    def drainEvents(self):
+        self.lp.poll_events()
+        
+        events = []
+        but = self.lp.button_state_xy()
+        while but != []:
+            events.append(but)
+            but = self.lp.button_state_xy()
+        
+        return events
+    
     # Calculate the board's boundaries based on dimensions and draw it
     def initializeBoard(self):
         # Calculate board boundaries from width and height
@@ -168,94 +214,129 @@ class TileFlipGame:
         self.boardHeightMin = math.ceil((9 - self.boardHeight) / 2.0)
         self.boardHeightMax = self.boardHeightMin + self.boardHeight
         
-        # Make all inside leds green
-        for i in range(0, 8):
-            for j in range(1, 9):
-                self.lp.led_ctrl_xy(i, j, 0, 3)
+        # Make all inside leds green and board leds red, as one grid frame
+        # (grid LED at x, y is at index (y - 1) * 8 + x)
+        leds = bytearray([self.lp.led_get_color(0, 3)]) * 64
+        boardRow = bytearray([self.lp.led_get_color(3, 0)]) * self.boardWidth
+        for j in range(self.boardHeightMin, self.boardHeightMax):
+            rowStart = (j - 1) * 8 + self.boardWidthMin
+            leds[rowStart:rowStart + self.boardWidth] = boardRow
+        
+        self.lp.led_ctrl_grid(leds)
         
-        # Make board leds red
-        for i in range(self.boardWidthMin, self.boardWidthMax):
-            for j in range(self.boardHeightMin, self.boardHeightMax):
-                self.lp.led_ctrl_xy(i, j, 3, 0)
+        # The masks only depend on the board's size, so keep them until it
+        # changes
+        if (self.boardWidth, self.boardHeight) != self.maskSize:
+            self.buildMasks()
         
-        # Initialize logical board (set to True)
-        self.board = [[True for j in range(0, self.boardHeight)]
-                      for i in range(0, self.boardWidth)]
+        # Initialize logical board (all tiles on)
+        self.board = self.fullMask
     
-    numClicks = boardWidth * boardHeight * 2
+    # Build the masks for the board's current dimensions
+    def buildMasks(self):
+        # Keep the board with every tile on to check for a win against
+        self.fullMask = self.fullBoard()
+        
+        # Define coordinates of tiles to flip relative to pressed tile
+        dx = [0, 0, 1, 0, -1]
+        dy = [0, -1, 0, 1, 0]
+        
+        # Pressing a tile flips it and the surrounding tiles within the board
+        self.flipMasks = {}
+        for i in range(0, self.boardWidth):
+            for j in range(0, self.boardHeight):
+                flipMask = 0
+                for k in range(0, len(dx)):
+                    flipX = i + dx[k]
+                    flipY = j + dy[k]
+                    if 0 <= flipX < self.boardWidth:
+                        if 0 <= flipY < self.boardHeight:
+                            flipMask |= 1 << (flipX * 8 + flipY)
+                
+                self.flipMasks[(i + self.boardWidthMin,
+                                j + self.boardHeightMin)] = flipMask
+        
+        self.maskSize = (self.boardWidth, self.boardHeight)
+    
+    numClicks = 0  # Presses in a scramble, two per tile of the board
     startDelay = 750
     
     # Does a nice real-time scrambling of the board
     def scramble(self):
+        # The number of presses depends on the chosen board size
+        self.numClicks = self.boardWidth * self.boardHeight * 2
+        
         # Create animation speed curve (rational function)
         a = self.startDelay * (1 + (1 / self.numClicks))
         b = self.startDelay - a
         
-        def getDelay(t):
-            return a * (1 / (t + 1)) + b
+        # Wait after each press, in ms (based on the speed curve)
+        delays = tuple(int(a * (1 / (t + 1)) + b)
+                       for t in range(0, self.numClicks))
+        
+        # Every board tile, to pick random tiles from
+        tiles = [(x, y)
+                 for x in range(self.boardWidthMin, self.boardWidthMax)
+                 for y in range(self.boardHeightMin, self.boardHeightMax)]
         
         # Press random tiles numClicks number of times
-        for i in range(0, self.numClicks):
+        for delay in delays:
             # Pick a random board tile and flip it
-            randX = randint(self.boardWidthMin, self.boardWidthMax - 1)
-            randY = randint(self.boardHeightMin, self.boardHeightMax - 1)
-            self.tilePress(randX, randY)
+            self.tilePress(*self.randomTile(tiles))
+            self.lp.draw()
             
-            # Wait (based on rational function speed curve from above)
-            delay = getDelay(i)
-            time.wait(int(delay))
+            time.wait(delay)
         
         # If a winning board comes up, scramble some more with 10 more presses
         while self.checkWin():
             for i in range(0, 10):
                 # Pick a random board tile and flip it
-                randX = randint(self.boardWidthMin, self.boardWidthMax - 1)
-                randY = randint(self.boardHeightMin, self.boardHeightMax - 1)
-                self.tilePress(randX, randY)
+                self.tilePress(*self.randomTile(tiles))
+                self.lp.draw()
                 
                 time.wait(1)
     
+    # Return a random tile from a list of tiles
+    def randomTile(self, tiles):
+        # Draw just enough random bits to index the list, trying again when
+        # the index is past the end so every tile is equally likely
+        numBits = (len(tiles) - 1).bit_length()
+        
+        i = getrandbits(numBits)
+        while i >= len(tiles):
+            i = getrandbits(numBits)
+        
+        return tiles[i]
+    
     # Try to flip the pressed tile and any surrounding tiles
     # Returns True if at least one tile was flipped
     def tilePress(self, x, y):
         # Don't count presses outside of board
-        if x < self.boardWidthMin or x >= self.boardWidthMax:
+        flipMask = self.flipMasks.get((x, y))
+        if flipMask is None:
             return False
         
-        if y < self.boardHeightMin or y >= self.boardHeightMax:
-            return False
+        # Flip all the tiles at once
+        self.board ^= flipMask
         
-        # Define coordinates of tiles to flip relative to pressed tile
-        dx = [0, 0, 1, 0, -1]
-        dy = [0, -1, 0, 1, 0]
-        
-        # Attempt to flip all specified tiles
-        for i in range(0, len(dx)):
-            flipX = x + dx[i]
-            flipY = y + dy[i]
+        # Redraw each flipped tile
+        while flipMask:
+            tileBit = flipMask & -flipMask
+            flipMask ^= tileBit
             
-            # Flip this tile if within boundaries of the board
-            if self.boardWidthMin <= flipX < self.boardWidthMax:
-                if self.boardHeightMin <= flipY < self.boardHeightMax:
-                    self.flipTile(flipX - self.boardWidthMin,
-                                  flipY - self.boardHeightMin)
+            flipX, flipY = divmod(tileBit.bit_length() - 1, 8)
+            if self.board & tileBit:
+                self.lp.led_ctrl_xy(flipX + self.boardWidthMin,
+                                    flipY + self.boardHeightMin,
+                                    3, 0)
+            else:
+                self.lp.led_ctrl_xy(flipX + self.boardWidthMin,
+                                    flipY + self.boardHeightMin,
+                                    0, 0)
         
         # Tile was flipped
         return True
     
-    # Flip the specified tile (in board coordinates)
-    def flipTile(self, x, y):
-        if self.board[x][y]:
-            self.board[x][y] = False
-            self.lp.led_ctrl_xy(x + self.boardWidthMin,
-                                y + self.boardHeightMin,
-                                0, 0)
-        else:
-            self.board[x][y] = True
-            self.lp.led_ctrl_xy(x + self.boardWidthMin,
-                                y + self.boardHeightMin,
-                                3, 0)
-    
     # Change the dimensions of the board based on the ID of the button pressed
     def dimensionChange(self, buttonId):
         switcher = {
@@ -274,15 +355,19 @@ class TileFlipGame:
         self.boardWidth = max(min(self.boardWidth, 8), 2)
         self.boardHeight = max(min(self.boardHeight, 8), 2)
     
-    def checkWin(self):
+    # Return the board with every tile on, for the current dimensions
+    def fullBoard(self):
+        column = (1 << self.boardHeight) - 1
+        
+        board = 0
         for i in range(0, self.boardWidth):
-            for j in range(0, self.boardHeight):
-                if not self.board[i][j]:
-                    # Not winning board if any square is False
-                    return False
+            board |= column << (i * 8)
         
-        # Every square must be True. Win!
-        return True
+        return board
+    
+    def checkWin(self):
+        # Every square must be on. Win!
+        return self.board == self.fullMask
     
     def win(self):
         # Disable input
@@ -306,6 +391,8 @@ class TileFlipGame:
         self.lp.open()
     
     quitBlinkSpd = 750
+    quitPeriodCoeff = 2 * math.pi / quitBlinkSpd
+    quitIntensity = -1  # Red intensity last drawn by quitAnimation()
     
     # Show quit text and quit game
     def quitGame(self):
@@ -321,10 +408,13 @@ class TileFlipGame:
         self.lp.open()
     
     def quitAnimation(self):
-        periodCoeff = 2 * math.pi / self.quitBlinkSpd
-        cosine = math.cos(periodCoeff * time.get_ticks())
-        redIntensity = 2 * cosine + 2
-        self.lp.led_ctrl_xy(8, 8, redIntensity, 0)
+        cosine = math.cos(self.quitPeriodCoeff * time.get_ticks())
+        redIntensity = min(int(2 * cosine + 2), 3)
+        
+        # Only draw the quit button when its intensity changes
+        if redIntensity != self.quitIntensity:
+            self.quitIntensity = redIntensity
+            self.lp.led_ctrl_xy(8, 8, redIntensity, 0)
     
     def __str__(self):
         return 'TileFlipGame'